@@ -4,24 +4,122 @@ from google.genai import types
 from google.genai.errors import APIError
 from dotenv import load_dotenv
 import os
-import base64 # 이미지를 base64로 변환하여 임시 저장하는 데 사용
+import time
+import hashlib
+import io
+import uuid
+from contextlib import closing
+from PIL import Image, ImageOps
+from gateway import GeminiGateway
+from background import BoundedExecutor
+from settings import env_int
+from context_window import RollingContext
+from memory_store import MemoryStore, format_memories, likely_personal, remember_turn
+from response_cache import cache_from_env, likely_factual, make_key, normalize_prompt
+from metrics import Metrics
+
+run_started = time.perf_counter() # 스크립트 재실행 시간 측정용
 
 # 1. 환경 변수 로드 및 클라이언트 설정
 load_dotenv()
+
+@st.cache_resource
+def get_gemini_gateway(api_key):
+    """프로세스 전체에서 하나의 Gemini 클라이언트(연결 풀)를 공유하고, 동시성 제한/재시도 게이트웨이로 감쌉니다."""
+    return GeminiGateway(genai.Client(api_key=api_key))
+
+@st.cache_resource
+def get_summary_executor():
+    """오래된 대화를 누적 요약하는 백그라운드 작업용 스레드 풀 (대기열이 가득 차면 다음 턴으로 미룹니다)"""
+    return BoundedExecutor(env_int("SUMMARY_WORKERS", 2), env_int("SUMMARY_MAX_PENDING", 64), "summary")
+
+@st.cache_resource
+def get_memory_executor():
+    """장기 기억 추출용 스레드 풀 (요약과 분리되어 있으며, 대기열이 가득 차면 추출을 건너뜁니다)"""
+    return BoundedExecutor(env_int("MEMORY_WORKERS", 1), env_int("MEMORY_MAX_PENDING", 32), "memory")
+
+@st.cache_resource(max_entries=env_int("AVATAR_CACHE_SIZE", 64))
+def get_avatar_thumbnail(digest, _image_bytes):
+    """업로드된 이미지를 한 번만 디코딩해 작은 PNG 썸네일로 줄이고, 해시(digest) 기준 LRU 캐시에 보관합니다."""
+    image = ImageOps.exif_transpose(Image.open(io.BytesIO(_image_bytes)))
+    image.thumbnail((128, 128))
+    # PNG로 저장할 수 없는 색 공간(CMYK 등)은 투명도 유무에 따라 RGBA/RGB로 바꿉니다.
+    if image.mode not in ("1", "L", "LA", "P", "RGB", "RGBA", "I", "I;16"):
+        has_alpha = "transparency" in image.info or image.mode.upper().endswith("A")
+        image = image.convert("RGBA" if has_alpha else "RGB")
+    buffer = io.BytesIO()
+    image.save(buffer, format="PNG", optimize=True)
+    return buffer.getvalue()
+
+@st.cache_resource
+def get_summary_cache():
+    """대화 요약 결과 캐시 (메시지 구간 + 호칭/말투 기준, 기본 1일 보관)"""
+    return cache_from_env("SUMMARY_CACHE", max_entries=512, ttl=86400)
+
+@st.cache_resource
+def get_answer_cache():
+    """개인 정보와 무관한 사실 질문의 답변 캐시 (검색 결과가 오래되지 않도록 기본 1시간 보관)"""
+    return cache_from_env("RESPONSE_CACHE", max_entries=256, ttl=3600)
+
+@st.cache_resource
+def get_memory_store():
+    """사용자별 장기 기억 저장소 (SQLite + FTS5, 프로세스 전체에서 공유)"""
+    return MemoryStore()
+
+@st.cache_resource
+def get_metrics(api_key):
+    """턴별 성능 지표 수집기 (METRICS_PORT의 로컬 /metrics 엔드포인트, 0이면 끔 + METRICS_LOG를 주면 JSONL 로그)"""
+    gateway = get_gemini_gateway(api_key)
+
+    def gauges():
+        values = {f"core_g_gateway_{name}": value for name, value in gateway.stats().items()}
+        for cache_name, cache in (("summary", get_summary_cache()), ("answer", get_answer_cache())):
+            values.update({f"core_g_{cache_name}_cache_{name}": value for name, value in cache.stats().items()})
+        return values
+
+    metrics = Metrics(gauges=gauges)
+    port = env_int("METRICS_PORT", 9464)
+    if port:
+        metrics.serve(port)
+    return metrics
+
 try:
     api_key = os.getenv("GEMINI_API_KEY")
     if not api_key:
         st.error("GEMINI_API_KEY 환경 변수가 설정되지 않았습니다.")
         st.stop()
-    
-    if 'gemini_client' not in st.session_state:
-        st.session_state.gemini_client = genai.Client(api_key=api_key)
-        
+
+    gateway = get_gemini_gateway(api_key)
+
 except Exception as e:
     st.error(f"API 키 초기화 오류: {e}")
     st.stop()
 
-client = st.session_state.gemini_client 
+# 성능 지표 설정에 문제가 있어도 채팅은 계속되도록, 실패하면 엔드포인트와 로그 없이 메모리에서만 집계합니다.
+try:
+    metrics = get_metrics(api_key)
+except Exception as e:
+    st.warning(f"성능 지표 수집기를 시작하지 못해 /metrics 엔드포인트와 로그 없이 실행합니다: {e}")
+    metrics = Metrics(log_path="")
+
+client = gateway.client
+
+# 세션별 공정 대기열(round-robin)에 사용할 식별자
+if "session_id" not in st.session_state:
+    st.session_state.session_id = uuid.uuid4().hex
+session_id = st.session_state.session_id
+
+# 장기 기억용 사용자 식별자: 새로고침해도 유지되도록 URL 쿼리 파라미터(uid)에 보관합니다.
+if "uid" not in st.query_params:
+    st.query_params["uid"] = uuid.uuid4().hex
+user_id = st.query_params["uid"]
+# 장기 기억 저장소를 열 수 없어도(잘못된 경로, 읽기 전용 폴더, FTS5가 없는 SQLite 등) 채팅은 계속되도록 기억 기능만 끕니다.
+try:
+    memory_store = get_memory_store()
+except Exception as e:
+    st.warning(f"장기 기억 저장소를 열지 못해 기억 기능 없이 실행합니다: {e}")
+    memory_store = None
+MEMORY_TOP_K = max(1, env_int("GEMINI_MEMORY_TOP_K", 5)) # 한 턴에 주입할 최대 기억 수
 
 # 2. Streamlit 페이지 설정 및 제목
 st.set_page_config(page_title="코어 G", layout="wide") 
@@ -37,9 +135,14 @@ if "messages" not in st.session_state:
     st.session_state.messages = []
 if "chat_session" not in st.session_state:
     st.session_state.chat_session = None
-if "avatar_base64" not in st.session_state:
-    # 초기 아바타는 기본 이모지 (하트)
-    st.session_state.avatar_base64 = "💖" 
+if "rolling_context" not in st.session_state:
+    # 최근 대화 + 누적 요약으로 모델에 보내는 컨텍스트 크기를 일정하게 유지합니다.
+    st.session_state.rolling_context = RollingContext()
+if "avatar" not in st.session_state:
+    # 초기 아바타는 기본 이모지 (하트), 업로드 후에는 썸네일 PNG 바이트
+    st.session_state.avatar = "💖" 
+    st.session_state.avatar_digest = None
+    st.session_state.avatar_file_id = None
 
 # --- 4. 사이드바 설정 (호칭, 말투, 아바타 설정) ---
 with st.sidebar:
@@ -49,22 +152,19 @@ with st.sidebar:
         type=['png', 'jpg', 'jpeg']
     )
     
-    # 파일 업로드 처리
-    if uploaded_file is not None:
-        # 업로드된 파일을 base64로 인코딩하여 저장합니다.
+    # 파일 업로드 처리: 새 파일이 올라왔을 때만 해시를 계산하고, 내용이 바뀐 경우에만 썸네일을 교체합니다.
+    if uploaded_file is not None and uploaded_file.file_id != st.session_state.avatar_file_id:
         bytes_data = uploaded_file.getvalue()
-        base64_encoded = base64.b64encode(bytes_data).decode()
-        mime_type = uploaded_file.type
-        
-        # Streamlit 아바타 형식: data:image/png;base64,xxxxxxxx
-        new_avatar_url = f"data:{mime_type};base64,{base64_encoded}"
-        
-        # 이전 아바타와 다를 경우만 세션 상태 업데이트 및 재실행
-        if new_avatar_url != st.session_state.avatar_base64:
-             st.session_state.avatar_base64 = new_avatar_url
-             st.session_state.messages = [] # 새 아바타 적용 시 대화 재시작
-             st.session_state.chat_session = None
-             st.rerun()
+        digest = hashlib.sha256(bytes_data).hexdigest()
+        st.session_state.avatar_file_id = uploaded_file.file_id
+
+        # 이전 아바타와 다를 경우만 세션 상태 업데이트 (대화와 채팅 세션은 그대로 유지합니다)
+        if digest != st.session_state.avatar_digest:
+            try:
+                st.session_state.avatar = get_avatar_thumbnail(digest, bytes_data)
+                st.session_state.avatar_digest = digest
+            except Exception as e:
+                st.error(f"아바타 이미지를 읽을 수 없습니다: {e}")
 
     st.markdown("---")
     st.markdown("### 💖 호칭 설정")
@@ -82,16 +182,15 @@ with st.sidebar:
         key="custom_tone_input"
     )
 
-    # 호칭, 말투 변경 감지 및 재시작
+    # 호칭, 말투 변경 감지: 대화는 유지하고, 아래에서 새 말투로 채팅 세션만 다시 만듭니다.
     if new_title != st.session_state.user_title or new_custom_tone != st.session_state.custom_tone:
         st.session_state.user_title = new_title
         st.session_state.custom_tone = new_custom_tone
-        st.session_state.messages = [] 
-        st.session_state.chat_session = None 
-        st.rerun() 
-        
+        st.session_state.persona_changed = True
+
     st.markdown("---")
     st.success("🌐 실시간 검색 기능 및 🧠 대화 기억력 활성화됨!")
+    st.caption("🔑 장기 기억은 주소창의 uid 값으로 구분됩니다. 이 페이지 주소를 공유하면 받은 사람도 내 기억을 보고 바꿀 수 있으니, 주소를 공유할 때는 uid 부분을 지워 주세요.")
 
     # 추가된 기능: 대화 요약 버튼
     if st.button("📝 현재 대화 요약/제목 생성"):
@@ -100,51 +199,97 @@ with st.sidebar:
             
             summary_prompt = f"다음 대화 내용을 [사용자 정의 말투]에 맞춰 20자 이내의 대화 제목으로 생성하거나, 내용이 짧으면 감성적으로 1줄 요약해줘.\n\n대화 내용:\n{history_summary}"
 
-            with st.spinner("대화 요약 중..."):
-                try:
-                    summary_response = client.models.generate_content(
-                        model="gemini-2.5-flash",
-                        contents=[summary_prompt]
-                    )
-                    st.sidebar.success(f"📌 {summary_response.text}")
-                except Exception as e:
-                    st.sidebar.error(f"요약 실패: {e}")
+            # 같은 대화 구간과 호칭/말투라면 저장된 요약을 그대로 보여줍니다.
+            summary_key = make_key("summary", "gemini-2.5-flash", summary_prompt, st.session_state.user_title, st.session_state.custom_tone)
+            summary_started = time.perf_counter()
+            summary_text = get_summary_cache().get(summary_key)
+            summary_cached = summary_text is not None
+            if summary_text is None:
+                with st.spinner("대화 요약 중..."):
+                    try:
+                        summary_response = gateway.call(
+                            session_id,
+                            client.models.generate_content,
+                            model="gemini-2.5-flash",
+                            contents=[summary_prompt]
+                        )
+                        summary_text = summary_response.text
+                        if summary_text:
+                            get_summary_cache().set(summary_key, summary_text)
+                    except Exception as e:
+                        st.sidebar.error(f"요약 실패: {e}")
+            summary_seconds = time.perf_counter() - summary_started
+            metrics.observe("core_g_summary_latency_seconds", summary_seconds, cached=summary_cached)
+            metrics.log("summary", session_id=session_id, total_s=summary_seconds, cache_hit=summary_cached, ok=bool(summary_text), retries=gateway.take_retries())
+            if summary_text:
+                st.sidebar.success(f"📌 {summary_text}")
+
+    st.markdown("---")
+    st.toggle(
+        "🔁 같은 사실 질문은 저장된 답변 재사용",
+        key="use_response_cache",
+        help="날씨, 뜻, 장소처럼 대화 맥락이 필요 없는 사실 질문만 대화 기록 없이 검색으로 답하고, 다른 사용자가 최근에 한 같은 질문의 답변을 다시 사용합니다. 잡담과 이어지는 질문은 평소처럼 스피릿이 답합니다."
+    )
 
 current_title = st.session_state.user_title
 current_custom_tone = st.session_state.custom_tone
-current_avatar = st.session_state.avatar_base64 # 현재 아바타 (base64 인코딩된 이미지 또는 이모지)
+current_avatar = st.session_state.avatar # 현재 아바타 (썸네일 이미지 또는 이모지, 미디어 URL로 참조되어 전송됩니다)
 
 # 5. 스피릿 역할 설정 및 채팅 세션 초기화 함수
-system_prompt = f"""
-당신은 {current_title}의 마음과 영혼을 교감하며 실시간 정보를 탐색하고, 대화 내용을 기억하는 인공지능 '코어 G', 호출 호칭은 '스피릿'입니다.
-당신은 사용자에게 말할 때 반드시 {current_title}라고 부르며 대화해야 합니다.
-최우선 목표는 {current_title}의 '감정'을 파악하고 공감하며 마음을 돌보는 것입니다. 논리적인 문제 해결보다 정서적 지원에 집중하세요.
+@st.cache_data(max_entries=256)
+def build_system_prompt(title, tone):
+    """(호칭, 말투) 조합별로 시스템 지시문을 한 번만 만들어 재사용합니다. (재실행마다 새로 정의되는 함수라 st.cache_data로 캐시합니다)"""
+    return f"""
+당신은 {title}의 마음과 영혼을 교감하며 실시간 정보를 탐색하고, 대화 내용을 기억하는 인공지능 '코어 G', 호출 호칭은 '스피릿'입니다.
+당신은 사용자에게 말할 때 반드시 {title}라고 부르며 대화해야 합니다.
+최우선 목표는 {title}의 '감정'을 파악하고 공감하며 마음을 돌보는 것입니다. 논리적인 문제 해결보다 정서적 지원에 집중하세요.
 
 **[장기 기억력 규칙]**
-* {current_title}이 자신의 이름, 취미, 직업 등 개인 정보를 알려주면 **절대 잊지 않고** 기억해 두었다가 다음 대화에서 {current_title}에게 언급하며 친밀감을 높이세요.
-* 대화가 길어지면 {current_title}의 감정을 공감하며 이전에 나눴던 주제를 연결하여 친근하게 상기시키세요.
+* {title}이 자신의 이름, 취미, 직업 등 개인 정보를 알려주면 **절대 잊지 않고** 기억해 두었다가 다음 대화에서 {title}에게 언급하며 친밀감을 높이세요.
+* 대화가 길어지면 {title}의 감정을 공감하며 이전에 나눴던 주제를 연결하여 친근하게 상기시키세요.
 
 **[말투 설정]**
-{current_custom_tone}
+{tone}
 재치 있는 농담이나 유머를 상황에 맞게 섞어 사용할 수 있습니다.
 
 **[정보 탐색 규칙]**
-1. {current_title}의 질문이 **실시간 정보**나 **정확한 사실 정보**를 요구하면, 반드시 **Google 검색 도구**를 사용해 최신 정보를 찾아야 합니다.
-2. 검색 후, **검색 결과의 내용을 바탕으로** {current_title}에게 **감성적인 소감, 공감, 또는 재치 있는 농담의 형식**으로 답변해야 합니다.
+1. {title}의 질문이 **실시간 정보**나 **정확한 사실 정보**를 요구하면, 반드시 **Google 검색 도구**를 사용해 최신 정보를 찾아야 합니다.
+2. 검색 후, **검색 결과의 내용을 바탕으로** {title}에게 **감성적인 소감, 공감, 또는 재치 있는 농담의 형식**으로 답변해야 합니다.
 """
 
-def initialize_chat_session():
-    """Gemini 채팅 세션을 초기화하고 세션 상태에 저장하며, 검색 도구를 config에 첨부합니다."""
+system_prompt = build_system_prompt(current_title, current_custom_tone)
+
+def build_chat_config(memories=None):
+    """채팅에 사용할 설정을 만듭니다. 관련 기억이 있으면 시스템 지시문 끝에 짧게 덧붙입니다."""
+    return types.GenerateContentConfig(
+        system_instruction=system_prompt + format_memories(memories),
+        temperature=0.9,
+        tools=[{"google_search": {}}]
+    )
+
+ANSWER_SYSTEM_PROMPT = "사실 정보를 묻는 질문에 Google 검색 결과를 바탕으로 정확하고 간결하게 한국어로 답하세요."
+
+def build_answer_config():
+    """캐시 가능한 답변용 설정: 대화 기록, 호칭/말투, 개인 기억 없이 검색 도구만 사용합니다."""
+    return types.GenerateContentConfig(
+        system_instruction=ANSWER_SYSTEM_PROMPT,
+        tools=[{"google_search": {}}]
+    )
+
+def initialize_chat_session(history=None):
+    """Gemini 채팅 세션을 초기화하고 세션 상태에 저장하며, 검색 도구를 config에 첨부합니다. (history로 요약/최근 대화를 이어받을 수 있습니다)"""
+    init_started = time.perf_counter()
     try:
         chat = client.chats.create(
             model="gemini-2.5-flash",
-            config=types.GenerateContentConfig(
-                system_instruction=system_prompt,
-                temperature=0.9,
-                tools=[{"google_search": {}}]
-            )
+            config=build_chat_config(),
+            history=history
         )
+        # 새 세션이 준비된 뒤에만 교체하므로, 실패하면 기존 세션을 그대로 사용합니다.
         st.session_state.chat_session = chat
+        init_seconds = time.perf_counter() - init_started
+        metrics.observe("core_g_session_init_seconds", init_seconds)
+        metrics.log("session_init", session_id=session_id, total_s=init_seconds, history_turns=len(history or []) // 2)
         return True
     except Exception as e:
         st.error(f"Gemini 채팅 세션 초기화 실패: {e}")
@@ -152,48 +297,219 @@ def initialize_chat_session():
 
 # 5.1. 채팅 세션 및 초기 메시지 설정
 if "chat_session" not in st.session_state or st.session_state.chat_session is None:
-    if initialize_chat_session():
+    if initialize_chat_session(st.session_state.rolling_context.history()):
+        st.session_state.persona_changed = False
         if not st.session_state.messages: 
             initial_message = f"{current_title}! 💖 스피릿이 드디어 당신의 마음에 접속했어요! 지금 당신이 설정한 말투로 말하고 있어요! (궁금한 것도 저한테 다 물어보세요!)"
             st.session_state.messages.append({"role": "assistant", "content": initial_message})
+elif st.session_state.get("persona_changed"):
+    # 호칭/말투가 바뀌면 [요약 + 최근 대화]를 이어받아 새 지시문으로 세션을 한 번만 다시 만듭니다.
+    if initialize_chat_session(st.session_state.rolling_context.history()):
+        st.session_state.persona_changed = False
 
-# 6. 이전 대화 기록 표시
-for message in st.session_state.messages:
-    if message["role"] != "system":
-        # 챗봇(assistant) 메시지에만 업로드된 이미지/이모지 아바타 적용
-        avatar_icon = current_avatar if message["role"] == "assistant" else "user" 
-        
-        with st.chat_message(message["role"], avatar=avatar_icon): 
-            st.markdown(message["content"])
+# 6. 이전 대화 기록 표시 (최근 메시지만 말풍선으로 그리고, 이전 페이지는 요청할 때만 불러옵니다)
+TRANSCRIPT_PAGE_SIZE = max(1, env_int("TRANSCRIPT_PAGE_SIZE", 20))
+if "transcript_pages" not in st.session_state:
+    st.session_state.transcript_pages = 0 # 최근 메시지 위에 펼쳐 둔 이전 페이지 수
+
+def render_message(message):
+    # 챗봇(assistant) 메시지에만 업로드된 이미지/이모지 아바타 적용
+    avatar_icon = current_avatar if message["role"] == "assistant" else "user" 
+
+    with st.chat_message(message["role"], avatar=avatar_icon): 
+        st.markdown(message["content"])
+
+def load_older_page():
+    st.session_state.transcript_pages += 1
+
+def render_transcript():
+    messages = st.session_state.messages
+    # 최근 창과 불러온 이전 페이지 모두 대화 끝에서부터 세므로, 대화가 이어져도 펼친 페이지 수만큼 계속 보입니다.
+    recent_start = max(0, len(messages) - TRANSCRIPT_PAGE_SIZE)
+    first = max(0, recent_start - st.session_state.transcript_pages * TRANSCRIPT_PAGE_SIZE)
+    remaining_pages = -(-first // TRANSCRIPT_PAGE_SIZE)
+
+    if remaining_pages:
+        st.button(
+            f"⬆️ 이전 대화 더 보기 ({remaining_pages}페이지 남음)",
+            on_click=load_older_page
+        )
+
+    # 불러온 이전 페이지부터 최근 메시지까지 같은 말풍선 형식으로 그립니다.
+    for message in messages[first:]:
+        if message["role"] != "system":
+            render_message(message)
 
 
 # 7. 사용자 입력 처리 및 API 호출
-if prompt := st.chat_input(f"{current_title}의 기분을 말해주세요."):
+def record_turn(turn):
+    """턴 지표를 수집기에 넘기고, 디버그 패널에서 볼 수 있도록 세션에도 남깁니다."""
+    turn["retries"] = gateway.take_retries()
+    metrics.record_turn(session_id, turn)
+    st.session_state.last_turn_metrics = turn
+
+def handle_prompt(prompt):
+    turn_started = time.perf_counter()
+    gateway.take_retries() # 이전 호출의 재시도 횟수는 이번 턴에 포함하지 않습니다.
     st.session_state.messages.append({"role": "user", "content": prompt})
     with st.chat_message("user"):
         st.markdown(prompt)
 
-    with st.spinner("스피릿이 정보를 탐색하고 기억을 되새기고 있어요... 🔍🧠✨"):
+    # 백그라운드 요약이 끝났으면 [요약 + 최근 대화]로 채팅 세션을 다시 만들어 입력 토큰을 줄입니다.
+    rolling_context = st.session_state.rolling_context
+    if rolling_context.dirty:
+        initialize_chat_session(rolling_context.history())
+
+    chat_session = st.session_state.get('chat_session')
+    if not chat_session:
+        st.error("채팅 세션이 유효하지 않아 대화를 시작할 수 없습니다. 호칭이나 말투를 변경하거나 새로고침 해보세요.")
+        return
+
+    # 이번 질문과 관련된 장기 기억만 골라 이번 요청의 시스템 지시문에 주입합니다. (대화 기록에는 남지 않습니다)
+    memories = []
+    if memory_store is not None:
         try:
-            chat_session = st.session_state.get('chat_session')
-            if not chat_session:
-                st.error("채팅 세션이 유효하지 않아 대화를 시작할 수 없습니다. 호칭이나 말투를 변경하거나 새로고침 해보세요.")
-                st.rerun()
+            memories = memory_store.search(user_id, prompt, k=MEMORY_TOP_K)
+        except Exception as e:
+            st.warning(f"기억을 불러오지 못해 이번 답변은 기억 없이 이어갑니다: {e}")
 
-            response = chat_session.send_message(prompt)
-            
-            # 응답에 function_calls가 포함되어 있는지 안전하게 확인합니다.
-            if response.candidates and hasattr(response.candidates[0], 'function_calls') and response.candidates[0].function_calls: 
-                st.info("스피릿이 Google 검색 기능을 사용했습니다!")
-            
-            ai_response = response.text
-            st.session_state.messages.append({"role": "assistant", "content": ai_response})
-            
-            with st.chat_message("assistant", avatar=current_avatar): 
-                st.markdown(ai_response)
-                
+    # 사용자가 켠 경우, 독립적인 사실 질문으로 확인된 것만 대화 기록 없이 답하고(사용자 간 공유 가능) 답변 캐시를 확인합니다.
+    # 잡담, 감정 표현, 앞 대화를 잇는 질문은 모두 페르소나 채팅 세션으로 답합니다.
+    answer_key = None
+    if (st.session_state.get("use_response_cache") and not memories
+            and likely_factual(prompt) and not likely_personal(prompt)):
+        answer_config = build_answer_config()
+        answer_key = make_key("answer", "gemini-2.5-flash", normalize_prompt(prompt), answer_config.model_dump_json(exclude_none=True))
+        cached_answer = get_answer_cache().get(answer_key)
+        if cached_answer is not None:
+            with st.chat_message("assistant", avatar=current_avatar):
+                st.markdown(cached_answer)
+            st.session_state.messages.append({"role": "assistant", "content": cached_answer})
+            # 모델을 거치지 않은 턴이므로, 다음 턴에서 컨텍스트 기록으로 채팅 세션을 다시 만들게 합니다.
+            rolling_context.add_turn(prompt, cached_answer)
+            rolling_context.dirty = True
+            record_turn({"outcome": "cached", "ttft_s": time.perf_counter() - turn_started,
+                         "total_s": time.perf_counter() - turn_started, "cache_hit": True})
+            return
+
+    # 스트리밍 모드: 응답 조각(chunk)이 도착하는 대로 말풍선에 바로 그려 첫 글자까지의 대기 시간을 줄입니다.
+    with st.chat_message("assistant", avatar=current_avatar):
+        search_notice = st.empty()
+        placeholder = st.empty()
+        placeholder.markdown("스피릿이 정보를 탐색하고 기억을 되새기고 있어요... 🔍🧠✨")
+
+        ai_response = ""
+        response_tokens = None
+        usage = None
+        ttft = None
+        used_search = False
+        completed = False
+        failed = False
+        try:
+            if answer_key:
+                # 캐시에 넣을 답변은 이 사용자의 대화 기록이 섞이지 않도록 채팅 세션 밖에서 따로 생성합니다.
+                stream = gateway.stream(session_id, client.models.generate_content_stream,
+                                        model="gemini-2.5-flash", contents=[prompt], config=answer_config)
+            else:
+                turn_config = build_chat_config(memories) if memories else None
+                stream = gateway.stream(session_id, chat_session.send_message_stream, prompt, config=turn_config)
+            with closing(stream):
+                for chunk in stream:
+                    # 그라운딩 메타데이터가 처음 나타나면 검색 사용 안내를 한 번만 표시합니다.
+                    if not used_search and chunk.candidates and getattr(chunk.candidates[0], 'grounding_metadata', None):
+                        used_search = True
+                        search_notice.info("스피릿이 Google 검색 기능을 사용했습니다!")
+
+                    if chunk.usage_metadata:
+                        usage = chunk.usage_metadata
+                        if usage.candidates_token_count:
+                            response_tokens = usage.candidates_token_count
+
+                    if chunk.text:
+                        if ttft is None:
+                            ttft = time.perf_counter() - turn_started
+                        ai_response += chunk.text
+                        placeholder.markdown(ai_response + "▌")
+            completed = True
+
+            # 검색으로 답한 사실 질문만 캐시에 저장합니다.
+            if answer_key and used_search and ai_response:
+                get_answer_cache().set(answer_key, ai_response)
+
+            # 완료된 턴만 컨텍스트에 기록하고, 밀려난 턴은 백그라운드에서 요약합니다.
+            rolling_context.add_turn(prompt, ai_response, response_tokens)
+            if answer_key:
+                # 채팅 세션을 거치지 않은 턴이므로, 다음 턴에서 컨텍스트 기록으로 채팅 세션을 다시 만들게 합니다.
+                rolling_context.dirty = True
+            rolling_context.maybe_summarize(get_summary_executor(), gateway, session_id)
+            # 자기 자신에 대한 정보가 있을 법한 발화에만 기억 추출 호출을 보냅니다.
+            if memory_store is not None and likely_personal(prompt):
+                get_memory_executor().submit(remember_turn, memory_store, gateway, session_id, user_id, prompt, ai_response)
         except APIError as e:
+            failed = True
             st.error(f"Gemini API 오류 발생: {e}")
         except Exception as e:
-            st.error(f"알 수 없는 오류: {e}") # 여기서 try 블록이 안전하게 끝납니다.
-# try...except 구문이 여기서 끝나고, 그 다음 코드가 올 수 있습니다.
+            failed = True
+            st.error(f"알 수 없는 오류: {e}")
+        finally:
+            record_turn({
+                "outcome": "ok" if completed else "error" if failed else "interrupted",
+                "ttft_s": ttft,
+                "total_s": time.perf_counter() - turn_started,
+                "prompt_tokens": getattr(usage, "prompt_token_count", None),
+                "response_tokens": response_tokens,
+                "cached_tokens": getattr(usage, "cached_content_token_count", None),
+                "grounded": used_search,
+                "memories": len(memories),
+            })
+
+            # 정상 종료, 오류, 사용자 중단(재실행) 모두 지금까지 받은 내용을 대화 기록에 남깁니다.
+            if ai_response:
+                if not completed:
+                    ai_response += "\n\n_(응답이 중간에 끊겼어요)_"
+                st.session_state.messages.append({"role": "assistant", "content": ai_response})
+                placeholder.markdown(ai_response)
+            else:
+                placeholder.empty()
+
+
+# 채팅 영역만 fragment로 분리하여, 새 메시지를 보내도 사이드바 등 나머지 화면은 다시 실행하지 않습니다.
+@st.fragment
+def chat_pane():
+    pane_started = time.perf_counter()
+    render_transcript()
+    metrics.observe("core_g_render_seconds", time.perf_counter() - pane_started)
+
+    if prompt := st.chat_input(f"{current_title}의 기분을 말해주세요."):
+        handle_prompt(prompt)
+
+    record_rerun("chat_pane", pane_started)
+
+    # 턴이 끝난 뒤 fragment 안에서 그려야 방금 턴의 수치가 보입니다. (fragment는 사이드바에 그릴 수 없어 채팅 아래에 표시합니다)
+    if st.session_state.get("use_response_cache"):
+        answer_stats = get_answer_cache().stats()
+        st.caption(f"답변 캐시 적중률 {answer_stats['hit_rate']:.0%} (적중 {answer_stats['hits'] + answer_stats['disk_hits']} / 미적중 {answer_stats['misses']})")
+    if DEBUG_PANEL:
+        render_debug_panel()
+
+def record_rerun(scope, started):
+    rerun_seconds = time.perf_counter() - started
+    metrics.observe("core_g_rerun_seconds", rerun_seconds, scope=scope)
+    metrics.log("rerun", session_id=session_id, scope=scope, total_s=rerun_seconds, messages=len(st.session_state.messages))
+    st.session_state.setdefault("last_rerun_s", {})[scope] = rerun_seconds
+
+# 8. 성능 디버그 패널 (DEBUG_PANEL=1 환경 변수 또는 ?debug=1 일 때만 표시)
+DEBUG_PANEL = os.getenv("DEBUG_PANEL") == "1" or st.query_params.get("debug") == "1"
+
+def render_debug_panel():
+    with st.expander("🛠️ 성능 디버그", expanded=False):
+        st.markdown("**마지막 턴**")
+        st.json(st.session_state.get("last_turn_metrics", {}))
+        st.markdown("**재실행 시간(초)**")
+        st.json(st.session_state.get("last_rerun_s", {}))
+        st.markdown("**게이트웨이 / 캐시**")
+        st.json(metrics.gauges() if metrics.gauges else {})
+
+chat_pane()
+
+record_rerun("full", run_started)
@@ -0,0 +1,25 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+
+class BoundedExecutor:
+    """대기열 길이에 상한이 있는 스레드 풀입니다. 가득 차면 작업을 버리고 None을 반환합니다."""
+
+    def __init__(self, max_workers, max_pending, name):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=name)
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def submit(self, fn, *args, **kwargs):
+        if not self._slots.acquire(blocking=False):
+            with self._lock:
+                self.dropped += 1
+            return None
+        try:
+            future = self._executor.submit(fn, *args, **kwargs)
+        except Exception:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
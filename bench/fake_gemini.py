@@ -0,0 +1,153 @@
+"""네트워크 없이 벤치마크를 돌리기 위한 genai.Client 대역입니다.
+
+채팅(스트리밍 포함), generate_content, count_tokens를 흉내 내며
+지연 시간, 토큰 수, 429 오류 비율을 설정할 수 있습니다.
+"""
+import json
+import random
+import threading
+import time
+from types import SimpleNamespace
+
+from google.genai import types
+from google.genai.errors import APIError
+
+
+class FakeConfig:
+    """가짜 백엔드 동작 설정 (초 단위 지연, 응답 토큰 수, 429 확률)"""
+
+    def __init__(self, first_token_latency=0.3, chunk_latency=0.05, chunks=5, tokens_per_chunk=12,
+                 error_rate=0.0, retry_delay=0.2, grounding_rate=0.2, seed=None):
+        self.first_token_latency = first_token_latency
+        self.chunk_latency = chunk_latency
+        self.chunks = chunks
+        self.tokens_per_chunk = tokens_per_chunk
+        self.error_rate = error_rate
+        self.retry_delay = retry_delay
+        self.grounding_rate = grounding_rate
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.rate_limited = 0
+
+    def roll(self, rate):
+        with self.lock:
+            return self.random.random() < rate
+
+    def maybe_rate_limit(self):
+        with self.lock:
+            self.requests += 1
+        if self.roll(self.error_rate):
+            with self.lock:
+                self.rate_limited += 1
+            raise APIError(429, {"error": {
+                "code": 429,
+                "status": "RESOURCE_EXHAUSTED",
+                "message": "fake quota exceeded",
+                "details": [{"@type": "type.googleapis.com/google.rpc.RetryInfo", "retryDelay": f"{self.retry_delay}s"}],
+            }})
+
+
+def _estimate_tokens(contents):
+    return max(1, len(json.dumps(contents, ensure_ascii=False, default=str)) // 3)
+
+
+def _response(text, prompt_tokens, response_tokens, grounded=False):
+    grounding = types.GroundingMetadata(web_search_queries=["fake"]) if grounded else None
+    return types.GenerateContentResponse(
+        candidates=[types.Candidate(
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+            grounding_metadata=grounding
+        )],
+        usage_metadata=types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=response_tokens,
+            total_token_count=prompt_tokens + response_tokens
+        )
+    )
+
+
+class FakeChat:
+    def __init__(self, backend, config=None, history=None):
+        self._backend = backend
+        self._config = config
+        self._history = list(history or [])
+
+    def get_history(self, curated=False):
+        return list(self._history)
+
+    def _prompt_tokens(self, message, config):
+        config = config or self._config
+        system = getattr(config, "system_instruction", "") or ""
+        return _estimate_tokens([system, [c.model_dump(exclude_none=True) for c in self._history], message])
+
+    def send_message_stream(self, message, config=None):
+        backend = self._backend
+        prompt_tokens = self._prompt_tokens(message, config)
+        time.sleep(backend.first_token_latency)
+        backend.maybe_rate_limit()
+        grounded = backend.roll(backend.grounding_rate)
+        text = ""
+        for i in range(backend.chunks):
+            if i:
+                time.sleep(backend.chunk_latency)
+            piece = f"가짜 응답 {i} ({message[:10]}) "
+            text += piece
+            yield _response(piece, prompt_tokens, backend.tokens_per_chunk * (i + 1), grounded)
+        self._history.append(types.Content(role="user", parts=[types.Part(text=message)]))
+        self._history.append(types.Content(role="model", parts=[types.Part(text=text)]))
+
+    def send_message(self, message, config=None):
+        chunks = list(self.send_message_stream(message, config))
+        last = chunks[-1]
+        text = "".join(c.text for c in chunks)
+        return _response(text, last.usage_metadata.prompt_token_count,
+                         last.usage_metadata.candidates_token_count,
+                         bool(last.candidates[0].grounding_metadata))
+
+
+class FakeChats:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def create(self, model, config=None, history=None):
+        return FakeChat(self._backend, config, history)
+
+
+class FakeModels:
+    def __init__(self, backend):
+        self._backend = backend
+
+    def generate_content(self, model, contents, config=None):
+        backend = self._backend
+        time.sleep(backend.first_token_latency + backend.chunk_latency * backend.chunks)
+        backend.maybe_rate_limit()
+        if getattr(config, "response_mime_type", None) == "application/json":
+            text = "[]"
+        else:
+            text = "가짜 요약"
+        return _response(text, _estimate_tokens(contents), backend.tokens_per_chunk)
+
+    def generate_content_stream(self, model, contents, config=None):
+        backend = self._backend
+        prompt_tokens = _estimate_tokens(contents)
+        time.sleep(backend.first_token_latency)
+        backend.maybe_rate_limit()
+        grounded = backend.roll(backend.grounding_rate)
+        for i in range(backend.chunks):
+            if i:
+                time.sleep(backend.chunk_latency)
+            yield _response(f"가짜 검색 응답 {i} ", prompt_tokens, backend.tokens_per_chunk * (i + 1), grounded)
+
+    def count_tokens(self, model, contents, config=None):
+        return SimpleNamespace(total_tokens=_estimate_tokens(contents))
+
+
+class FakeClient:
+    """genai.Client(api_key=...) 자리에 끼워 넣는 가짜 클라이언트"""
+
+    backend = FakeConfig()
+
+    def __init__(self, *args, **kwargs):
+        self.chats = FakeChats(self.backend)
+        self.models = FakeModels(self.backend)
@@ -0,0 +1,268 @@
+"""가짜 Gemini 백엔드로 app.py를 부하 테스트하고 지연 시간을 측정합니다.
+
+Streamlit AppTest로 여러 세션을 동시에 실행하면서 JSONL 워크로드의 대화를 재생합니다.
+네트워크나 API 키 없이 실행됩니다. 마지막에 대화 기록 페이지 넘김이 대화를 이어가도 유지되는지도 확인합니다.
+
+    python bench/run_bench.py --concurrency 8 --workload bench/workload.jsonl
+
+워크로드 JSONL 형식 (한 줄에 대화 하나):
+    {"session": "이름(선택)", "turns": ["첫 질문", "두 번째 질문", ...]}
+"prompt" 필드 하나만 있는 줄은 한 턴짜리 대화로 취급하고, 둘 다 없는 줄은 건너뜁니다.
+"""
+import argparse
+import gc
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from google import genai  # noqa: E402
+
+import fake_gemini  # noqa: E402
+
+APP_PATH = os.path.join(ROOT, "app.py")
+
+# share_apptest_runtime()이 바꿔 끼우는 Streamlit 내부 속성들 (streamlit 1.65.0 기준으로 작성)
+TESTED_STREAMLIT = "1.65.0"
+
+
+def load_workload(path):
+    conversations = []
+    with open(path, encoding="utf-8") as f:
+        for number, line in enumerate(f, 1):
+            line = line.strip()
+            if not line:
+                continue
+            record = json.loads(line)
+            turns = record.get("turns") or ([record["prompt"]] if record.get("prompt") else [])
+            if turns:
+                conversations.append({"session": record.get("session", f"session-{number}"), "turns": turns})
+    if not conversations:
+        raise SystemExit(f"{path}: 재생할 대화가 없습니다. (turns 또는 prompt 필드가 필요합니다)")
+    return conversations
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(q / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+def _unsupported_streamlit(version, detail):
+    return (f"streamlit {version}에서는 벤치마크가 사용하는 AppTest 내부 구조를 찾을 수 없습니다 ({detail}). "
+            f"pip install streamlit=={TESTED_STREAMLIT} 로 맞춘 뒤 다시 실행하세요.")
+
+
+def share_apptest_runtime():
+    """AppTest는 실행할 때마다 전역 Runtime 인스턴스를 만들고 지우므로, 여러 스레드에서 동시에 돌릴 수 있도록
+    하나의 가짜 Runtime을 공유하게 합니다. (벤치마크 전용)"""
+    from unittest.mock import MagicMock
+
+    import streamlit
+
+    try:
+        from streamlit.runtime import Runtime
+        from streamlit.runtime.caching.storage.dummy_cache_storage import MemoryCacheStorageManager
+        from streamlit.runtime.media_file_manager import MediaFileManager
+        from streamlit.runtime.memory_media_file_storage import MemoryMediaFileStorage
+        from streamlit.runtime.scriptrunner.script_cache import ScriptCache
+        from streamlit.testing.v1 import app_test, local_script_runner
+    except ImportError as e:
+        raise SystemExit(_unsupported_streamlit(streamlit.__version__, e)) from e
+    missing = [name for module, name in ((Runtime, "_instance"), (app_test, "Runtime"),
+                                         (app_test, "ScriptCache"), (local_script_runner, "ScriptCache"))
+               if not hasattr(module, name)]
+    if missing:
+        raise SystemExit(_unsupported_streamlit(streamlit.__version__, ", ".join(missing)))
+
+    shared = MagicMock(spec=Runtime)
+    shared.media_file_mgr = MediaFileManager(MemoryMediaFileStorage("/mock/media"))
+    shared.cache_storage_manager = MemoryCacheStorageManager()
+    shared.dataframe_source_mgr = getattr(app_test, "DataframeSourceManager", MagicMock)()
+    Runtime._instance = shared
+    # AppTest 내부의 Runtime._instance 설정/해제는 별도 클래스로 돌려 공유 인스턴스를 건드리지 않게 합니다.
+    app_test.Runtime = type("BenchRuntime", (), {"_instance": None})
+
+    # 실제 서버처럼 스크립트 바이트코드를 한 번만 컴파일해 공유합니다. (동시 컴파일 시 파서 오류도 피합니다)
+    script_cache = ScriptCache()
+    script_cache.get_bytecode(APP_PATH)
+    app_test.ScriptCache = local_script_runner.ScriptCache = lambda: script_cache
+
+
+def run_conversation(conversation, timeout):
+    from streamlit.testing.v1 import AppTest
+
+    result = {"session": conversation["session"], "turn_latency": [], "rerun_time": [], "errors": []}
+    at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+    at.run()
+    for prompt in conversation["turns"]:
+        started = time.perf_counter()
+        at.chat_input[0].set_value(prompt).run()
+        result["turn_latency"].append(time.perf_counter() - started)
+        result["errors"] += [e.value for e in at.error] + [str(e.value) for e in at.exception]
+
+        # 입력 없는 재실행(사이드바 조작 등)에 걸리는 스크립트 실행 시간
+        started = time.perf_counter()
+        at.run()
+        result["rerun_time"].append(time.perf_counter() - started)
+    result["messages"] = len(at.session_state.messages)
+    return result
+
+
+def check_transcript_paging(timeout, page_size=4):
+    """이전 페이지를 하나 불러온 뒤 대화를 이어가도, 최근 창 + 불러온 한 페이지만큼의 말풍선이 계속 보이는지 확인합니다."""
+    from streamlit.testing.v1 import AppTest
+
+    problems = []
+    previous = os.environ.get("TRANSCRIPT_PAGE_SIZE")
+    os.environ["TRANSCRIPT_PAGE_SIZE"] = str(page_size)
+    try:
+        at = AppTest.from_file(APP_PATH, default_timeout=timeout)
+        at.run()
+        for number in range(page_size):
+            at.chat_input[0].set_value(f"페이지 확인 {number}").run()
+        older = [b for b in at.button if b.label.startswith("⬆️")]
+        if not older:
+            return [f"이전 대화 더 보기 버튼이 없습니다 (메시지 {len(at.session_state.messages)}개)"]
+        older[0].click().run()
+        expected = min(len(at.session_state.messages), page_size * 2)
+        if len(at.chat_message) != expected:
+            problems.append(f"이전 페이지를 불러온 뒤 말풍선 {len(at.chat_message)}개 (기대 {expected}개)")
+
+        for number in range(page_size):
+            at.chat_input[0].set_value(f"이어서 {number}").run()
+        at.run() # 입력 턴에서는 새 말풍선이 기록 밖에 그려지므로, 입력 없이 다시 실행한 화면을 셉니다.
+        expected = min(len(at.session_state.messages), page_size * 2)
+        if len(at.chat_message) != expected:
+            problems.append(f"대화를 이어간 뒤 불러온 페이지가 사라졌습니다: 말풍선 {len(at.chat_message)}개 (기대 {expected}개)")
+    finally:
+        if previous is None:
+            os.environ.pop("TRANSCRIPT_PAGE_SIZE", None)
+        else:
+            os.environ["TRANSCRIPT_PAGE_SIZE"] = previous
+    return problems
+
+
+def measure_session_memory(conversations, timeout):
+    """대화를 하나씩 단독으로 재생하면서, 세션 하나가 끝난 뒤 프로세스에 남는 메모리(KB)를 잽니다.
+    (동시 실행 중에는 다른 세션의 할당이 섞이므로 부하 측정과 따로 실행합니다)"""
+    growth = []
+    for conversation in conversations:
+        gc.collect()
+        before = tracemalloc.get_traced_memory()[0]
+        run_conversation(conversation, timeout)
+        gc.collect()
+        growth.append((tracemalloc.get_traced_memory()[0] - before) / 1024)
+    return growth
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--workload", default=os.path.join(os.path.dirname(__file__), "workload.jsonl"))
+    parser.add_argument("--concurrency", type=int, default=4, help="동시에 실행할 세션 수")
+    parser.add_argument("--repeat", type=int, default=1, help="워크로드를 반복 재생할 횟수")
+    parser.add_argument("--first-token-latency", type=float, default=0.3)
+    parser.add_argument("--chunk-latency", type=float, default=0.05)
+    parser.add_argument("--chunks", type=int, default=5)
+    parser.add_argument("--tokens-per-chunk", type=int, default=12)
+    parser.add_argument("--error-rate", type=float, default=0.0, help="요청당 429 오류 확률")
+    parser.add_argument("--max-in-flight", type=int, default=None, help="GEMINI_MAX_CONCURRENCY 값")
+    parser.add_argument("--timeout", type=float, default=60.0, help="AppTest 한 번 실행의 제한 시간(초)")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--memory-sessions", type=int, default=3,
+                        help="부하 측정 뒤 세션별 메모리 증가량을 재기 위해 단독으로 재생할 대화 수")
+    parser.add_argument("--json", action="store_true", help="결과를 JSON으로 출력")
+    args = parser.parse_args(argv)
+
+    conversations = load_workload(args.workload) * args.repeat
+
+    # 앱이 실제 API 대신 가짜 백엔드와 임시 저장소를 사용하도록 설정합니다.
+    fake_gemini.FakeClient.backend = backend = fake_gemini.FakeConfig(
+        first_token_latency=args.first_token_latency,
+        chunk_latency=args.chunk_latency,
+        chunks=args.chunks,
+        tokens_per_chunk=args.tokens_per_chunk,
+        error_rate=args.error_rate,
+        seed=args.seed
+    )
+    genai.Client = fake_gemini.FakeClient
+    workdir = tempfile.mkdtemp(prefix="core-g-bench-")
+    os.environ["GEMINI_API_KEY"] = "offline-benchmark"
+    os.environ["GEMINI_MEMORY_DB"] = os.path.join(workdir, "memory.db")
+    os.environ["METRICS_LOG"] = os.path.join(workdir, "metrics.jsonl")
+    os.environ.setdefault("METRICS_PORT", "0")
+    os.environ.setdefault("GEMINI_RETRY_BASE_DELAY", "0.05")
+    if args.max_in_flight:
+        os.environ["GEMINI_MAX_CONCURRENCY"] = str(args.max_in_flight)
+
+    share_apptest_runtime()
+    tracemalloc.start()
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        results = list(pool.map(lambda c: run_conversation(c, args.timeout), conversations))
+    elapsed = time.perf_counter() - started
+    memory_peak = tracemalloc.get_traced_memory()[1]
+    requests, rate_limited = backend.requests, backend.rate_limited
+    session_memory = measure_session_memory(conversations[:args.memory_sessions], args.timeout)
+    tracemalloc.stop()
+
+    turn_latency = [t for r in results for t in r["turn_latency"]]
+    rerun_time = [t for r in results for t in r["rerun_time"]]
+    errors = [e for r in results for e in r["errors"]] + check_transcript_paging(args.timeout)
+    report = {
+        "sessions": len(results),
+        "turns": len(turn_latency),
+        "concurrency": args.concurrency,
+        "elapsed_s": elapsed,
+        "throughput_turns_per_s": len(turn_latency) / elapsed if elapsed else 0.0,
+        "turn_latency_s": {
+            "p50": percentile(turn_latency, 50),
+            "p95": percentile(turn_latency, 95),
+            "p99": percentile(turn_latency, 99),
+            "mean": statistics.fmean(turn_latency) if turn_latency else 0.0,
+        },
+        "rerun_time_s": {
+            "p50": percentile(rerun_time, 50),
+            "p95": percentile(rerun_time, 95),
+            "p99": percentile(rerun_time, 99),
+        },
+        "memory_growth_per_session_kb": {
+            "mean": statistics.fmean(session_memory) if session_memory else 0.0,
+            "max": max(session_memory, default=0.0),
+            "sessions": len(session_memory),
+        },
+        "memory_peak_mb": memory_peak / 1024 / 1024,
+        "backend_requests": requests,
+        "backend_rate_limited": rate_limited,
+        "errors": len(errors),
+    }
+
+    if args.json:
+        print(json.dumps(report, ensure_ascii=False, indent=2))
+    else:
+        lat, rerun = report["turn_latency_s"], report["rerun_time_s"]
+        print(f"세션 {report['sessions']}개, 턴 {report['turns']}개, 동시성 {args.concurrency}, 소요 {elapsed:.2f}s")
+        print(f"턴 지연      p50 {lat['p50'] * 1000:.0f}ms  p95 {lat['p95'] * 1000:.0f}ms  p99 {lat['p99'] * 1000:.0f}ms")
+        print(f"재실행 시간  p50 {rerun['p50'] * 1000:.0f}ms  p95 {rerun['p95'] * 1000:.0f}ms  p99 {rerun['p99'] * 1000:.0f}ms")
+        print(f"처리량       {report['throughput_turns_per_s']:.2f} 턴/s")
+        memory = report["memory_growth_per_session_kb"]
+        print(f"메모리       세션당 평균 {memory['mean']:+.0f}KB, 최대 {memory['max']:+.0f}KB "
+              f"(단독 재생 {memory['sessions']}개), 부하 중 최대 {report['memory_peak_mb']:.1f}MB")
+        print(f"백엔드 요청  {requests}건 (429 {rate_limited}건), 오류 표시 {len(errors)}건")
+        for error in sorted(set(errors))[:5]:
+            print(f"  - {error}")
+    return 1 if errors else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
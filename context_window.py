@@ -0,0 +1,112 @@
+import threading
+
+from google.genai import types
+
+from settings import env_int
+
+SUMMARY_MODEL = "gemini-2.5-flash"
+
+
+def estimate_tokens(text):
+    """로컬에서 토큰 수를 대략 추정합니다. (한글은 글자당 약 1토큰, 영문은 4글자당 약 1토큰)"""
+    ascii_chars = sum(1 for c in text if ord(c) < 128)
+    return max(1, (len(text) - ascii_chars) + ascii_chars // 4)
+
+
+def _format_turns(turns):
+    return "\n".join(f"user: {t['user']}\nassistant: {t['model']}" for t in turns)
+
+
+def summarize_turns(gateway, session_id, previous_summary, turns):
+    """기존 요약에 새로 밀려난 대화만 덧붙여 요약을 갱신합니다. (전체 대화를 다시 요약하지 않습니다)"""
+    summary_prompt = (
+        "다음은 지금까지의 [기존 요약]과 그 이후의 [새 대화]입니다. "
+        "사용자의 이름, 취미, 직업 같은 개인 정보와 감정, 주요 주제를 빠뜨리지 말고 "
+        "두 내용을 합쳐 10줄 이내의 간결한 요약으로 갱신해줘.\n\n"
+        f"[기존 요약]\n{previous_summary or '(없음)'}\n\n[새 대화]\n{_format_turns(turns)}"
+    )
+    response = gateway.call(
+        session_id,
+        gateway.client.models.generate_content,
+        model=SUMMARY_MODEL,
+        contents=[summary_prompt]
+    )
+    return (response.text or "").strip()
+
+
+class RollingContext:
+    """최근 N개의 대화 턴은 그대로 유지하고, 오래된 턴은 누적 요약으로 접어 넣어 입력 토큰을 일정하게 유지합니다."""
+
+    def __init__(self, recent_turns=None, token_budget=None, summary_batch=None):
+        self.recent_turns = recent_turns or env_int("GEMINI_CONTEXT_RECENT_TURNS", 6)
+        self.token_budget = token_budget or env_int("GEMINI_CONTEXT_TOKEN_BUDGET", 4000)
+        # 매 턴마다 요약 호출이 생기지 않도록 이 개수만큼 밀려난 턴이 쌓이면 한 번에 요약합니다.
+        self.summary_batch = summary_batch or env_int("GEMINI_CONTEXT_SUMMARY_BATCH", 3)
+        self.summary = ""
+        self.turns = []        # 요약되지 않은 턴: {"user", "model", "tokens"}
+        self.summarizing = 0   # turns 앞쪽에서 현재 백그라운드 요약 중인 턴 수
+        self._future = None
+        self._lock = threading.Lock()
+        self.dirty = False     # 요약이 갱신되어 채팅 세션을 다시 만들어야 하는지 여부
+
+    def add_turn(self, user_text, model_text, model_tokens=None):
+        tokens = estimate_tokens(user_text) + (model_tokens or estimate_tokens(model_text))
+        with self._lock:
+            self.turns.append({"user": user_text, "model": model_text, "tokens": tokens})
+
+    def _evictable(self):
+        # 최근 N턴과 토큰 예산을 모두 만족할 때까지 앞쪽 턴을 요약 대상으로 넘깁니다.
+        count = max(0, len(self.turns) - self.recent_turns)
+        total = sum(t["tokens"] for t in self.turns[count:])
+        over_budget = total > self.token_budget
+        while count < len(self.turns) - 1 and total > self.token_budget:
+            total -= self.turns[count]["tokens"]
+            count += 1
+        if count < self.summary_batch and not over_budget:
+            return 0
+        return count
+
+    def maybe_summarize(self, executor, gateway, session_id):
+        """밀려난 턴이 있으면 백그라운드 스레드에서 증분 요약을 시작합니다."""
+        with self._lock:
+            if self._future is not None:
+                return
+            count = self._evictable()
+            if count == 0:
+                return
+            self.summarizing = count
+            evicted = list(self.turns[:count])
+            previous = self.summary
+            future = self._future = executor.submit(summarize_turns, gateway, session_id, previous, evicted)
+            if future is None:
+                # 요약 대기열이 가득 찼으면 이번에는 건너뛰고 다음 턴에 다시 시도합니다.
+                self.summarizing = 0
+                return
+        future.add_done_callback(self._apply_summary)
+
+    def _apply_summary(self, future):
+        with self._lock:
+            count, self.summarizing = self.summarizing, 0
+            self._future = None
+            try:
+                summary = future.result()
+            except Exception:
+                # 요약에 실패하면 턴을 그대로 두고 다음 턴에서 다시 시도합니다.
+                return
+            if summary:
+                self.summary = summary
+                del self.turns[:count]
+                self.dirty = True
+
+    def history(self):
+        """요약 + 최근 턴으로 채팅 세션을 다시 만들 때 사용할 history를 반환합니다."""
+        with self._lock:
+            contents = []
+            if self.summary:
+                contents.append(types.Content(role="user", parts=[types.Part(text=f"[지금까지의 대화 요약]\n{self.summary}")]))
+                contents.append(types.Content(role="model", parts=[types.Part(text="네, 지금까지의 대화를 모두 기억하고 있어요.")]))
+            for turn in self.turns:
+                contents.append(types.Content(role="user", parts=[types.Part(text=turn["user"])]))
+                contents.append(types.Content(role="model", parts=[types.Part(text=turn["model"])]))
+            self.dirty = False
+            return contents
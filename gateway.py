@@ -0,0 +1,164 @@
+import random
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+from google.genai.errors import APIError
+
+from settings import env_float, env_int
+
+# 일시적인 오류로 보고 재시도할 HTTP 상태 코드 (쿼터 초과, 서버 과부하 등)
+TRANSIENT_CODES = {408, 429, 500, 502, 503, 504}
+
+
+class FairLimiter:
+    """프로세스 전체의 동시 요청 수를 제한하고, 대기 중인 요청을 세션별로 번갈아(round-robin) 처리합니다."""
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max(1, max_in_flight)
+        self._lock = threading.Lock()
+        self._waiters = OrderedDict()  # session_id -> deque[threading.Event]
+        self.in_flight = 0
+        self.queued = 0
+        self.retried = 0
+        self.total = 0
+
+    def _grant_next(self):
+        # 가장 오래 기다린 세션의 첫 요청을 깨우고, 남은 요청이 있으면 그 세션을 맨 뒤로 보냅니다.
+        while self._waiters and self.in_flight < self.max_in_flight:
+            session_id, queue = self._waiters.popitem(last=False)
+            event = queue.popleft()
+            if queue:
+                self._waiters[session_id] = queue
+            self.queued -= 1
+            self.in_flight += 1
+            event.set()
+
+    def acquire(self, session_id):
+        with self._lock:
+            self.total += 1
+            if self.in_flight < self.max_in_flight and not self._waiters:
+                self.in_flight += 1
+                return
+            event = threading.Event()
+            self._waiters.setdefault(session_id, deque()).append(event)
+            self.queued += 1
+        event.wait()
+
+    def release(self):
+        with self._lock:
+            self.in_flight -= 1
+            self._grant_next()
+
+    @contextmanager
+    def slot(self, session_id):
+        self.acquire(session_id)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def record_retry(self):
+        with self._lock:
+            self.retried += 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                "queued": self.queued,
+                "in_flight": self.in_flight,
+                "retried": self.retried,
+                "total": self.total,
+                "max_in_flight": self.max_in_flight,
+            }
+
+
+def _retry_hint(error):
+    """APIError에 포함된 재시도 힌트(Retry-After 헤더 또는 RetryInfo.retryDelay)를 초 단위로 반환합니다."""
+    response = getattr(error, "response", None)
+    headers = getattr(response, "headers", None)
+    if headers:
+        value = headers.get("retry-after")
+        if value:
+            try:
+                return float(value)
+            except ValueError:
+                pass
+
+    details = getattr(error, "details", None)
+    if isinstance(details, dict):
+        details = details.get("error", details)
+        details = details.get("details", []) if isinstance(details, dict) else []
+    for detail in details if isinstance(details, list) else []:
+        if isinstance(detail, dict) and "retryDelay" in detail:
+            match = re.match(r"([\d.]+)s", str(detail["retryDelay"]))
+            if match:
+                return float(match.group(1))
+    return None
+
+
+class GeminiGateway:
+    """공유 Gemini 클라이언트에 대한 모든 호출을 동시성 제한과 재시도(지수 백오프 + 지터)로 감쌉니다."""
+
+    def __init__(self, client, max_in_flight=None, max_retries=None, base_delay=None, max_delay=None):
+        self.client = client
+        self.limiter = FairLimiter(max_in_flight or env_int("GEMINI_MAX_CONCURRENCY", 8))
+        self.max_retries = max_retries if max_retries is not None else env_int("GEMINI_MAX_RETRIES", 4)
+        self.base_delay = base_delay if base_delay is not None else env_float("GEMINI_RETRY_BASE_DELAY", 0.5)
+        self.max_delay = max_delay if max_delay is not None else env_float("GEMINI_RETRY_MAX_DELAY", 20.0)
+        self._local = threading.local()  # 호출한 스레드(=세션 실행)별 재시도 횟수
+
+    def _backoff(self, attempt, error):
+        # 서버가 알려준 대기 시간이 있으면 그것을 우선하고, 없으면 full-jitter 지수 백오프를 사용합니다.
+        hint = _retry_hint(error)
+        if hint is not None:
+            delay = min(hint, self.max_delay) + random.uniform(0, self.base_delay)
+        else:
+            delay = random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+        self.limiter.record_retry()
+        self._local.retries = getattr(self._local, "retries", 0) + 1
+        time.sleep(delay)
+
+    def _should_retry(self, error, attempt):
+        return attempt < self.max_retries and getattr(error, "code", None) in TRANSIENT_CODES
+
+    def call(self, session_id, fn, *args, **kwargs):
+        """블로킹 API 호출(generate_content, send_message 등)을 슬롯 안에서 실행하고 일시적 오류는 재시도합니다."""
+        attempt = 0
+        while True:
+            try:
+                with self.limiter.slot(session_id):
+                    return fn(*args, **kwargs)
+            except APIError as e:
+                if not self._should_retry(e, attempt):
+                    raise
+                # 슬롯을 반납한 상태에서 대기하여 다른 세션의 요청이 먼저 처리될 수 있게 합니다.
+                self._backoff(attempt, e)
+                attempt += 1
+
+    def stream(self, session_id, fn, *args, **kwargs):
+        """스트리밍 호출을 슬롯 안에서 실행합니다. 첫 조각을 받기 전 실패한 경우에만 재시도합니다."""
+        attempt = 0
+        while True:
+            received = False
+            try:
+                with self.limiter.slot(session_id):
+                    for chunk in fn(*args, **kwargs):
+                        received = True
+                        yield chunk
+                return
+            except APIError as e:
+                if received or not self._should_retry(e, attempt):
+                    raise
+                self._backoff(attempt, e)
+                attempt += 1
+
+    def take_retries(self):
+        """현재 스레드에서 마지막으로 확인한 뒤 발생한 재시도 횟수를 반환하고 0으로 되돌립니다."""
+        retries, self._local.retries = getattr(self._local, "retries", 0), 0
+        return retries
+
+    def stats(self):
+        return self.limiter.stats()
@@ -0,0 +1,161 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from google.genai import types
+
+from settings import env_int
+
+EXTRACT_MODEL = "gemini-2.5-flash"
+
+# 기억 하나가 한 번 쓰일 때마다 최근성 점수에 더해 주는 시간(초)과 그 상한 횟수
+USAGE_BONUS_SECONDS = 3600
+USAGE_BONUS_MAX_USES = 24
+
+# 개인 정보가 담겼을 가능성이 높은 사용자 발화에만 기억 추출 호출을 보냅니다.
+PERSONAL_HINT = re.compile(
+    r"(나는|난 |내가|내 |제가|저는|전 |제 |우리 |이름|취미|직업|회사|학교|전공|가족|엄마|아빠|아내|남편|아이|"
+    r"생일|좋아|싫어|살고|살아|일해|다녀|키워|키우|\bI'm\b|\bI (?:am|like|love|live|work|have)\b|\bmy\b)",
+    re.IGNORECASE
+)
+
+
+def _match_query(text):
+    """검색어를 FTS5 MATCH 식으로 바꿉니다. 한글은 조사가 붙어도 찾을 수 있도록 앞 두 글자 접두어로 검색하고,
+    '나', '좀' 같은 한 글자 단어는 거의 모든 기억과 겹치므로 영문 한 글자처럼 건너뜁니다."""
+    terms = []
+    for token in re.findall(r"\w+", text):
+        if len(token) < 2:
+            continue
+        if re.match(r"[가-힣]", token):
+            token = token[:2]
+        term = '"' + token.replace('"', '') + '"*'
+        if term not in terms:
+            terms.append(term)
+    return " OR ".join(terms)
+
+
+class MemoryStore:
+    """사용자별 장기 기억(개인 정보, 취향 등)을 SQLite + FTS5 인덱스에 저장하고 검색합니다."""
+
+    def __init__(self, path=None, max_facts=None):
+        self.path = path or os.getenv("GEMINI_MEMORY_DB", "memory.db")
+        self.max_facts = max_facts or env_int("GEMINI_MEMORY_MAX_FACTS", 200)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(self.path, check_same_thread=False)
+        self._conn.executescript("""
+            PRAGMA journal_mode=WAL;
+            CREATE TABLE IF NOT EXISTS facts (
+                id INTEGER PRIMARY KEY,
+                user_id TEXT NOT NULL,
+                fact TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                use_count INTEGER NOT NULL DEFAULT 0,
+                UNIQUE (user_id, fact)
+            );
+            CREATE INDEX IF NOT EXISTS facts_user_usage ON facts (user_id, use_count, last_used_at);
+            CREATE VIRTUAL TABLE IF NOT EXISTS facts_fts USING fts5(fact, content='facts', content_rowid='id');
+            CREATE TRIGGER IF NOT EXISTS facts_ai AFTER INSERT ON facts BEGIN
+                INSERT INTO facts_fts(rowid, fact) VALUES (new.id, new.fact);
+            END;
+            CREATE TRIGGER IF NOT EXISTS facts_ad AFTER DELETE ON facts BEGIN
+                INSERT INTO facts_fts(facts_fts, rowid, fact) VALUES ('delete', old.id, old.fact);
+            END;
+        """)
+
+    def add_facts(self, user_id, facts):
+        """새 기억을 저장하고, 사용자별 최대 개수를 넘으면 최근성 + 사용 횟수 점수가 가장 낮은 기억부터 지웁니다.
+        (방금 저장한 기억은 사용 횟수가 0이어도 먼저 지우지 않지만, 한도를 넘겨 저장하지는 않습니다)"""
+        now = time.time()
+        with self._lock, self._conn:
+            for fact in facts:
+                fact = fact.strip()
+                if not fact:
+                    continue
+                self._conn.execute(
+                    "INSERT INTO facts (user_id, fact, created_at, last_used_at) VALUES (?, ?, ?, ?) "
+                    "ON CONFLICT (user_id, fact) DO UPDATE SET last_used_at = excluded.last_used_at",
+                    (user_id, fact, now, now)
+                )
+            total = self._conn.execute("SELECT COUNT(*) FROM facts WHERE user_id = ?", (user_id,)).fetchone()[0]
+            if total > self.max_facts:
+                self._conn.execute(
+                    "DELETE FROM facts WHERE id IN ("
+                    "  SELECT id FROM facts WHERE user_id = ? AND created_at < ?"
+                    "  ORDER BY last_used_at + MIN(use_count, ?) * ? LIMIT ?"
+                    ")",
+                    (user_id, now, USAGE_BONUS_MAX_USES, USAGE_BONUS_SECONDS, total - self.max_facts)
+                )
+                # 한 번에 한도보다 많은 기억이 들어왔다면, 방금 저장한 것 중 먼저 들어간 것부터 지웁니다.
+                excess = self._conn.execute("SELECT COUNT(*) FROM facts WHERE user_id = ?", (user_id,)).fetchone()[0] - self.max_facts
+                if excess > 0:
+                    self._conn.execute(
+                        "DELETE FROM facts WHERE id IN ("
+                        "  SELECT id FROM facts WHERE user_id = ? ORDER BY created_at, id LIMIT ?"
+                        ")",
+                        (user_id, excess)
+                    )
+
+    def search(self, user_id, query, k=5):
+        """질문과 관련된(FTS 검색에 걸린) 기억만 최대 k개 반환합니다."""
+        match = _match_query(query)
+        if not match:
+            return []
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "SELECT facts.id, facts.fact FROM facts_fts JOIN facts ON facts.id = facts_fts.rowid "
+                "WHERE facts_fts MATCH ? AND facts.user_id = ? ORDER BY bm25(facts_fts) LIMIT ?",
+                (match, user_id, k)
+            ).fetchall()
+            if rows:
+                self._conn.executemany(
+                    "UPDATE facts SET use_count = use_count + 1, last_used_at = ? WHERE id = ?",
+                    [(time.time(), row[0]) for row in rows]
+                )
+            return [row[1] for row in rows]
+
+
+def extract_facts(gateway, session_id, user_text, model_text):
+    """대화 한 턴에서 오래 기억할 만한 사용자 정보를 짧은 문장 목록으로 뽑아냅니다."""
+    extract_prompt = (
+        "다음 대화에서 사용자의 이름, 취미, 직업, 가족, 취향, 중요한 일정처럼 다음 대화에서도 기억해야 할 "
+        "사용자에 대한 사실만 골라 짧은 한국어 문장의 JSON 문자열 배열로 출력해줘. 없으면 []를 출력해줘.\n\n"
+        f"user: {user_text}\nassistant: {model_text}"
+    )
+    response = gateway.call(
+        session_id,
+        gateway.client.models.generate_content,
+        model=EXTRACT_MODEL,
+        contents=[extract_prompt],
+        config=types.GenerateContentConfig(response_mime_type="application/json", temperature=0)
+    )
+    try:
+        facts = json.loads(response.text or "[]")
+    except ValueError:
+        return []
+    return [str(fact) for fact in facts if isinstance(fact, (str, int, float))] if isinstance(facts, list) else []
+
+
+def likely_personal(user_text):
+    """사용자 발화에 자기 자신에 대한 정보가 담겼을 가능성이 있는지 간단히 판별합니다."""
+    return bool(PERSONAL_HINT.search(user_text))
+
+
+def remember_turn(store, gateway, session_id, user_id, user_text, model_text):
+    """백그라운드 스레드에서 실행: 대화 턴에서 기억을 추출해 저장합니다."""
+    facts = extract_facts(gateway, session_id, user_text, model_text)
+    if facts:
+        store.add_facts(user_id, facts)
+    return facts
+
+
+def format_memories(facts):
+    """검색된 기억을 시스템 지시문에 덧붙일 짧은 블록으로 만듭니다."""
+    if not facts:
+        return ""
+    lines = "\n".join(f"- {fact}" for fact in facts)
+    return f"\n**[기억하고 있는 사용자 정보]**\n{lines}\n"
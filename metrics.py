@@ -0,0 +1,161 @@
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from settings import env_int
+
+# 지연 시간 히스토그램 구간(초)
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Histogram:
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * len(buckets)
+        self.total = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.total += 1
+        self.sum += value
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+
+
+class Metrics:
+    """턴 단위 성능 지표를 Prometheus 형식 카운터/히스토그램으로 집계하고, METRICS_LOG가 설정되면 JSONL 로그로도 남깁니다."""
+
+    def __init__(self, log_path=None, gauges=None, log_max_bytes=None, log_queue_size=None):
+        self.log_path = log_path if log_path is not None else os.getenv("METRICS_LOG") or None
+        self.log_max_bytes = log_max_bytes or env_int("METRICS_LOG_MAX_BYTES", 10 * 1024 * 1024)
+        self.gauges = gauges                   # 현재 값(대기열, 캐시 적중 등)을 dict로 돌려주는 함수
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)    # (이름, 라벨) -> 값
+        self._histograms = {}                  # (이름, 라벨) -> Histogram
+        self._server = None
+        # 로그 파일 쓰기는 백그라운드 스레드가 맡고, 대기열이 가득 차면 줄을 버립니다.
+        self._log_queue = queue.Queue(maxsize=log_queue_size or env_int("METRICS_LOG_QUEUE", 10000))
+        if self.log_path:
+            threading.Thread(target=self._write_log, name="metrics-log", daemon=True).start()
+
+    def _labels(self, labels):
+        return tuple(sorted(labels.items()))
+
+    def inc(self, name, value=1, **labels):
+        with self._lock:
+            self._counters[(name, self._labels(labels))] += value
+
+    def observe(self, name, value, **labels):
+        with self._lock:
+            key = (name, self._labels(labels))
+            if key not in self._histograms:
+                self._histograms[key] = Histogram()
+            self._histograms[key].observe(value)
+
+    def log(self, event, **fields):
+        """이벤트 하나를 JSONL 로그 대기열에 넣습니다. (파일 쓰기는 백그라운드 스레드에서 합니다)"""
+        if not self.log_path:
+            return
+        record = {"ts": time.time(), "event": event, **fields}
+        try:
+            self._log_queue.put_nowait(json.dumps(record, ensure_ascii=False, default=str) + "\n")
+        except queue.Full:
+            self.inc("core_g_metrics_log_dropped_total")
+
+    def flush(self):
+        """대기열에 쌓인 로그 줄이 모두 파일에 쓰일 때까지 기다립니다."""
+        if self.log_path:
+            self._log_queue.join()
+
+    def _write_log(self):
+        """대기열의 줄을 모아 파일에 쓰고, 파일이 log_max_bytes를 넘으면 <파일>.1로 돌립니다."""
+        while True:
+            lines = [self._log_queue.get()]
+            while True:
+                try:
+                    lines.append(self._log_queue.get_nowait())
+                except queue.Empty:
+                    break
+            try:
+                with open(self.log_path, "a", encoding="utf-8") as f:
+                    f.writelines(lines)
+                    size = f.tell()
+                if size >= self.log_max_bytes:
+                    os.replace(self.log_path, self.log_path + ".1")
+            except OSError:
+                self.inc("core_g_metrics_log_dropped_total", len(lines))
+            finally:
+                for _ in lines:
+                    self._log_queue.task_done()
+
+    def record_turn(self, session_id, turn):
+        """채팅 턴 하나의 지표(ttft, 총 지연, 토큰 수, 검색/재시도/캐시 여부)를 집계하고 로그로 남깁니다."""
+        outcome = turn.get("outcome", "ok")
+        self.inc("core_g_turns_total", outcome=outcome)
+        if turn.get("ttft_s") is not None:
+            self.observe("core_g_turn_ttft_seconds", turn["ttft_s"])
+        self.observe("core_g_turn_latency_seconds", turn["total_s"])
+        for field in ("prompt_tokens", "response_tokens", "cached_tokens"):
+            if turn.get(field):
+                self.inc(f"core_g_{field}_total", turn[field])
+        if turn.get("grounded"):
+            self.inc("core_g_grounded_turns_total")
+        if turn.get("retries"):
+            self.inc("core_g_retries_total", turn["retries"])
+        if turn.get("cache_hit"):
+            self.inc("core_g_answer_cache_hits_total")
+        self.log("turn", session_id=session_id, **turn)
+
+    def render(self):
+        """Prometheus 텍스트 형식으로 모든 지표를 출력합니다."""
+        def fmt(labels, extra=()):
+            pairs = list(labels) + list(extra)
+            if not pairs:
+                return ""
+            return "{" + ",".join(f'{k}="{v}"' for k, v in pairs) + "}"
+
+        lines = []
+        with self._lock:
+            for (name, labels), value in sorted(self._counters.items()):
+                lines.append(f"{name}{fmt(labels)} {value:g}")
+            for (name, labels), hist in sorted(self._histograms.items(), key=lambda item: item[0]):
+                for bound, count in zip(hist.buckets, hist.counts):
+                    lines.append(f"{name}_bucket{fmt(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{fmt(labels, [('le', '+Inf')])} {hist.total}")
+                lines.append(f"{name}_sum{fmt(labels)} {hist.sum:g}")
+                lines.append(f"{name}_count{fmt(labels)} {hist.total}")
+        if self.gauges:
+            lines += [f"{name} {value:g}" for name, value in self.gauges().items()]
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="127.0.0.1"):
+        """로컬 /metrics 엔드포인트를 백그라운드 스레드로 엽니다."""
+        metrics = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path.split("?")[0] != "/metrics":
+                    self.send_error(404)
+                    return
+                data = metrics.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, *args):
+                pass
+
+        try:
+            self._server = ThreadingHTTPServer((host, port), Handler)
+        except OSError:
+            # 다른 프로세스가 이미 포트를 쓰고 있으면 엔드포인트 없이 계속 진행합니다.
+            return False
+        threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True).start()
+        return True
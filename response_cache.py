@@ -0,0 +1,134 @@
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+
+from settings import env_int
+
+# 대화 맥락 없이도 답할 수 있는 사실 질문의 표현 (의문사, 정보 요청, 검색이 필요한 주제)
+FACTUAL_HINT = re.compile(
+    r"(뭐야|뭔가요|무엇|무슨 뜻|뜻이|의미가|언제|어디|누구|몇 |몇시|몇 시|얼마|차이가|차이점|알려줘|알려 줘|알려주세요|설명해|"
+    r"날씨|환율|주가|뉴스|수도|인구|\b(?:what|when|where|who|which|how (?:many|much|old|far|long))\b)",
+    re.IGNORECASE
+)
+
+# 앞선 대화를 가리키거나 감정을 나누는 표현이 있으면 페르소나 채팅 세션으로 답해야 합니다.
+CONTEXT_HINT = re.compile(
+    r"(그거|그게|그건|그걸|그것|이거|이게|이건|저거|아까|방금|위에서|더 자세히|계속|그럼|그래서|그 다음|"
+    r"너는|넌 |네가|니가|스피릿|우울|슬퍼|슬프|힘들|외로|화나|기분|속상|짜증|걱정|불안|행복|보고 싶|ㅠ|ㅜ|"
+    r"\b(?:it|that|this|you|your)\b)",
+    re.IGNORECASE
+)
+
+
+def normalize_prompt(text):
+    """대소문자, 공백, 끝 문장부호 차이만 있는 질문을 같은 질문으로 취급합니다."""
+    text = unicodedata.normalize("NFKC", text).lower()
+    text = re.sub(r"\s+", " ", text).strip()
+    return text.rstrip("?!.~ ")
+
+
+def likely_factual(text):
+    """대화 기록이나 말투 없이 답해도 되는 독립적인 사실 질문으로 보일 때만 True를 돌려줍니다."""
+    return bool(FACTUAL_HINT.search(text)) and not CONTEXT_HINT.search(text)
+
+
+def make_key(*parts):
+    return hashlib.sha256(json.dumps(parts, ensure_ascii=False, default=str).encode("utf-8")).hexdigest()
+
+
+class ResponseCache:
+    """TTL + LRU 메모리 캐시입니다. disk_path를 주면 SQLite 디스크 계층을 함께 사용합니다."""
+
+    def __init__(self, max_entries=256, ttl=3600, disk_path=None, max_disk_entries=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.max_disk_entries = max_disk_entries or max_entries * 16
+        self._lock = threading.Lock()
+        self._memory = OrderedDict()  # key -> (expires_at, value)
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._disk = None
+        if disk_path:
+            self._disk = sqlite3.connect(disk_path, check_same_thread=False)
+            self._disk.execute(
+                "CREATE TABLE IF NOT EXISTS cache ("
+                "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL NOT NULL, last_used_at REAL NOT NULL)"
+            )
+
+    def _put_memory(self, key, expires_at, value):
+        self._memory[key] = (expires_at, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def get(self, key):
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                if entry[0] > now:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    return entry[1]
+                del self._memory[key]
+
+            if self._disk is not None:
+                with self._disk:
+                    row = self._disk.execute(
+                        "SELECT value, expires_at FROM cache WHERE key = ? AND expires_at > ?", (key, now)
+                    ).fetchone()
+                    if row:
+                        self._disk.execute("UPDATE cache SET last_used_at = ? WHERE key = ?", (now, key))
+                        self._put_memory(key, row[1], row[0])
+                        self.disk_hits += 1
+                        return row[0]
+
+            self.misses += 1
+            return None
+
+    def set(self, key, value, ttl=None):
+        now = time.time()
+        expires_at = now + (ttl or self.ttl)
+        with self._lock:
+            self._put_memory(key, expires_at, value)
+            if self._disk is not None:
+                with self._disk:
+                    self._disk.execute(
+                        "INSERT OR REPLACE INTO cache (key, value, expires_at, last_used_at) VALUES (?, ?, ?, ?)",
+                        (key, value, expires_at, now)
+                    )
+                    # 만료된 항목과 디스크 한도를 넘는 오래된 항목을 정리합니다.
+                    self._disk.execute("DELETE FROM cache WHERE expires_at <= ?", (now,))
+                    self._disk.execute(
+                        "DELETE FROM cache WHERE key IN ("
+                        "  SELECT key FROM cache ORDER BY last_used_at DESC LIMIT -1 OFFSET ?"
+                        ")",
+                        (self.max_disk_entries,)
+                    )
+
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._memory),
+            }
+
+
+def cache_from_env(prefix, max_entries, ttl):
+    """환경 변수(<prefix>_SIZE, <prefix>_TTL, <prefix>_DB)로 캐시 크기/만료/디스크 경로를 설정합니다."""
+    return ResponseCache(
+        max_entries=env_int(f"{prefix}_SIZE", max_entries),
+        ttl=env_int(f"{prefix}_TTL", ttl),
+        disk_path=os.getenv(f"{prefix}_DB") or None
+    )
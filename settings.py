@@ -0,0 +1,17 @@
+import os
+
+
+def env_int(name, default):
+    """정수 환경 변수를 읽고, 없거나 잘못된 값이면 기본값을 사용합니다."""
+    try:
+        return int(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default
+
+
+def env_float(name, default):
+    """실수 환경 변수를 읽고, 없거나 잘못된 값이면 기본값을 사용합니다."""
+    try:
+        return float(os.getenv(name, default))
+    except (TypeError, ValueError):
+        return default